@@ -0,0 +1,60 @@
+#
+# Copyright (c) 2016 Intel Corporation
+#
+# Licensed under the Apache License, Version 2.0 (the 'License');
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an 'AS IS' BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""
+Utilities shared by the modules of this package.
+"""
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    # pylint: disable=import-error,no-name-in-module,unused-import
+    from orjson import dumps as json_dumps, loads as json_loads
+except ImportError:
+    import json
+    from json import loads as json_loads
+
+    def json_dumps(obj):
+        """Serializes an object to compact JSON encoded in UTF-8, like orjson.dumps does.
+
+        Args:
+            obj: JSON-serializable object.
+
+        Returns:
+            bytes: Serialized object.
+        """
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def parallel_map(function, items, max_workers):
+    """Calls a function for each of the items on a pool of threads.
+
+    Args:
+        function (callable): Function taking a single item.
+        items (list): Items to call the function for.
+        max_workers (int): Maximal number of simultaneous calls.
+
+    Returns:
+        list: Results of the calls, in the order of items.
+    """
+    if not items:
+        return []
+    pool = ThreadPool(min(max_workers, len(items)))
+    try:
+        return pool.map(function, items)
+    finally:
+        pool.close()
+        pool.join()
@@ -15,14 +15,25 @@
 #
 
 """
-Cloud Foundry REST API client wrapping "cf curl" command.
+Cloud Foundry REST API client. Uses API endpoint and OAuth token of the user logged in with CF CLI.
 """
 
-import json
+import os
+import threading
+import time
+
+import requests
 
 from app_deployment_lib import cf_cli
+from app_deployment_lib._common import json_loads, parallel_map
+
+SERVICE_INSTANCES_CACHE_TTL = 5
+MAX_PARALLEL_REQUESTS = 16
 
-CF_CURL = [cf_cli.CF, 'curl']
+_SERVICE_INSTANCES = {}
+_SERVICE_INSTANCES_CACHE = {'timestamp': 0, 'value': None}
+_SESSION = {'session': None, 'api_url': None, 'target': None}
+_SESSION_LOCK = threading.Lock()
 
 
 def create_service_key(service_guid, key_name):
@@ -33,10 +44,9 @@ def create_service_key(service_guid, key_name):
         key_name (str): Name of the newly created service key.
     """
     params = {'service_instance_guid': service_guid, 'name': key_name}
-    command_suffix = ['/v2/service_keys', '-X', 'POST', '-d', json.dumps(params)]
-    cmd_output = cf_cli.get_command_output(CF_CURL + command_suffix)
-    response_json = json.loads(cmd_output)
-    if 'error_code' not in response_json:
+    response = _request('POST', '/v2/service_keys', json=params)
+    response_json = json_loads(response.content)
+    if response_json.get('error_code') is None:
         return response_json
     else:
         raise cf_cli.CommandFailedError(
@@ -50,8 +60,7 @@ def delete_particular_service_key(key_guid):
     Args:
         key_guid (str): GUID of a service key
     """
-    command_suffix = ['/v2/service_keys/{}'.format(key_guid), '-X', 'DELETE', '-d', '']
-    cf_cli.get_command_output(CF_CURL + command_suffix)
+    _request('DELETE', '/v2/service_keys/{}'.format(key_guid))
 
 
 def get_temporary_key_data(instance_name, key_name='DummyKey123'):
@@ -76,13 +85,11 @@ def get_service_instance_guid(instance_name):
     Returns:
         str: Guid of a particular service instance.
     """
-    instance = get_service_instance(instance_name)
-    try:
-        guid = instance['metadata']['guid']
-        return guid
-    except:
+    instance = _find_service_instance(instance_name)
+    if instance is None:
         raise cf_cli.CommandFailedError(
             'Failed to get service {} guid.'.format(instance_name))
+    return instance['metadata']['guid']
 
 
 def get_service_instance(instance_name):
@@ -90,20 +97,100 @@ def get_service_instance(instance_name):
     Args:
         instance_name (str): name of a service instance
     Returns:
-        dict: Details of particular service instance.
+        dict: Details of particular service instance. Details are reused for
+            SERVICE_INSTANCES_CACHE_TTL seconds, see `invalidate_instance_cache`.
     """
-    cmd_output = cf_curl_get('/v2/service_instances?q=name:{}'.format(instance_name))
-    if cmd_output['total_results'] == 0:
+    instance = _find_service_instance(instance_name)
+    if instance is None:
         raise Exception("No service instance with name: {} found".format(instance_name))
-    return cmd_output['resources'][0]
+    return instance
+
+
+def get_service_instance_with_relations(instance_name):  # pylint: disable=invalid-name
+    """
+    Args:
+        instance_name (str): name of a service instance
+    Returns:
+        dict: Details of particular service instance, fetched in a single request together with
+            its service plan (entity.service_plan) and the plan's service
+            (entity.service_plan.entity.service).
+    """
+    path = '/v2/service_instances?q=name:{}&inline-relations-depth=2'.format(instance_name)
+    for resource in cf_curl_get(path)['resources']:
+        if resource['entity']['name'] == instance_name:
+            _cache_service_instance(instance_name, _without_inlined_relations(resource))
+            return resource
+    raise Exception("No service instance with name: {} found".format(instance_name))
+
+
+def _without_inlined_relations(resource):
+    entity = resource['entity']
+    return {
+        'metadata': resource['metadata'],
+        'entity': dict((key, value) for key, value in entity.items()
+                       if key + '_url' not in entity)
+    }
+
+
+def _find_service_instance(instance_name):
+    cached = _SERVICE_INSTANCES.get((_current_target(), instance_name))
+    if cached is not None and time.time() - cached[0] <= SERVICE_INSTANCES_CACHE_TTL:
+        return cached[1]
+    response = cf_curl_get('/v2/service_instances?q=name:{}'.format(instance_name))
+    for resource in response['resources']:
+        if resource['entity']['name'] == instance_name:
+            _cache_service_instance(instance_name, resource)
+            return resource
+    return None
+
+
+def _cache_service_instance(instance_name, resource):
+    _SERVICE_INSTANCES[(_current_target(), instance_name)] = (time.time(), resource)
 
 
 def get_all_service_instances():
     """
     Returns:
-        dict: All existing service instances,
+        dict: All existing service instances. Response is reused for SERVICE_INSTANCES_CACHE_TTL
+            seconds.
     """
-    return cf_curl_get('/v2/service_instances')
+    now = time.time()
+    if now - _SERVICE_INSTANCES_CACHE['timestamp'] > SERVICE_INSTANCES_CACHE_TTL:
+        _SERVICE_INSTANCES_CACHE['value'] = cf_curl_get('/v2/service_instances')
+        _SERVICE_INSTANCES_CACHE['timestamp'] = now
+    return _SERVICE_INSTANCES_CACHE['value']
+
+
+def get_all_service_instances_paged(results_per_page=100, max_workers=8):
+    """Gets service instances from all pages of the listing. Pages after the first one are
+    fetched in parallel.
+
+    Args:
+        results_per_page (int): Number of service instances fetched in a single request.
+        max_workers (int): Maximal number of pages fetched simultaneously.
+
+    Returns:
+        list[dict]: All existing service instances. Each has "metadata" and "entity" keys.
+    """
+    path = '/v2/service_instances?results-per-page={}&page={}'
+    first_page = cf_curl_get(path.format(results_per_page, 1))
+    resources = first_page['resources']
+    next_pages = range(2, first_page['total_pages'] + 1)
+    responses = parallel_map(
+        lambda page: cf_curl_get(path.format(results_per_page, page)), next_pages, max_workers)
+    for response in responses:
+        resources.extend(response['resources'])
+    return resources
+
+
+def invalidate_instance_cache():
+    """Forgets cached service instance data. Called by `reset_session` and after service
+    instances are created or updated with `cf_cli`. Should also be called after instances are
+    deleted.
+    """
+    _SERVICE_INSTANCES.clear()
+    _SERVICE_INSTANCES_CACHE['timestamp'] = 0
+    _SERVICE_INSTANCES_CACHE['value'] = None
 
 
 def create_service_binding(service_guid, app_guid):
@@ -114,10 +201,9 @@ def create_service_binding(service_guid, app_guid):
         app_guid (str): Applications' GUID.
     """
     params = {'service_instance_guid': service_guid, 'app_guid': app_guid}
-    command_suffix = ['/v2/service_bindings', '-X', 'POST', '-d', json.dumps(params)]
-    cmd_output = cf_cli.get_command_output(CF_CURL + command_suffix)
-    response_json = json.loads(cmd_output)
-    if 'error_code' not in response_json:
+    response = _request('POST', '/v2/service_bindings', json=params)
+    response_json = json_loads(response.content)
+    if response_json.get('error_code') is None:
         return response_json
     else:
         raise cf_cli.CommandFailedError(
@@ -132,10 +218,34 @@ def delete_service_binding(binding):
         binding (dict): JSON representing a service binding. Has "metadata" and "entity" keys.
     """
     binding_url = binding['metadata']['url']
-    cmd_output = cf_cli.get_command_output(CF_CURL + [binding_url, '-X', 'DELETE'])
-    if cmd_output:
+    response = _request('DELETE', binding_url)
+    if response.content:
         raise cf_cli.CommandFailedError('Failed to delete a service binding. CF response: {}'
-                                        .format(cmd_output))
+                                        .format(response.content))
+
+
+def delete_service_bindings(bindings, max_workers=MAX_PARALLEL_REQUESTS):
+    """Deletes service bindings in parallel.
+
+    Args:
+        bindings (list[dict]): JSONs representing service bindings, see `delete_service_binding`.
+        max_workers (int): Maximal number of bindings deleted simultaneously.
+
+    Raises:
+        CommandFailedError: When any of the bindings could not be deleted. Other bindings are
+            deleted anyway and the error describes all failures.
+    """
+    def _delete(binding):
+        try:
+            delete_service_binding(binding)
+        except cf_cli.CommandFailedError as ex:
+            return str(ex)
+        return None
+
+    errors = [error for error in parallel_map(_delete, bindings, max_workers) if error]
+    if errors:
+        raise cf_cli.CommandFailedError('Failed to delete {} of {} service bindings.\n{}'
+                                        .format(len(errors), len(bindings), '\n'.join(errors)))
 
 
 def get_app_name(app_guid):
@@ -180,7 +290,7 @@ def get_upsi_bindings(service_guid):
 
 
 def cf_curl_get(path):
-    """Calls "cf curl" with a given path.
+    """Calls GET on a given CF API path.
 
     Args:
         path (str): CF API path,
@@ -189,10 +299,97 @@ def cf_curl_get(path):
     Returns:
         dict: JSON returned by the endpoint.
     """
-    cmd_output = cf_cli.get_command_output(CF_CURL + [path])
-    response_json = json.loads(cmd_output)
-    if 'error_code' not in response_json:
+    response = _request('GET', path)
+    response_json = json_loads(response.content)
+    if response_json.get('error_code') is None:
         return response_json
     else:
         raise cf_cli.CommandFailedError('Failed GET on CF API path {}\n'
                                         'Response body: {}'.format(path, response_json))
+
+
+def get_session():
+    """Gets the session shared by all CF API calls, creating it on first use.
+    Keeping one session allows reusing the HTTP connections between the calls.
+    Certificates are validated unless CF CLI was set up with --skip-ssl-validation.
+
+    Returns:
+        requests.Session: Session authorized with OAuth token of the user logged in with CF CLI.
+            The token is refreshed when CF API rejects it.
+
+    Raises:
+        CommandFailedError: When CF CLI has no API endpoint set.
+    """
+    return _get_session_and_api_url()[0]
+
+
+def reset_session():
+    """Forgets the shared session and cached service instance data, so that the next CF API
+    call uses the API endpoint, user, org and space currently set in CF CLI.
+    Called after `cf_cli.api`, `cf_cli.auth` and `cf_cli.target`.
+    """
+    with _SESSION_LOCK:
+        _SESSION['session'] = None
+        _SESSION['api_url'] = None
+        _SESSION['target'] = None
+    invalidate_instance_cache()
+
+
+def _get_session_and_api_url():
+    with _SESSION_LOCK:
+        if _SESSION['session'] is None:
+            cf_target = cf_cli.get_current_cli_target()
+            api_url = cf_target[cf_cli.CfInfo.CF_API_KEY].rstrip('/')
+            if not api_url:
+                raise cf_cli.CommandFailedError(
+                    'CF CLI has no API endpoint set, log in with CF CLI first.')
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=MAX_PARALLEL_REQUESTS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.headers['Authorization'] = cf_cli.oauth_token()
+            session.verify = not _cli_skips_ssl_validation()
+            _SESSION['api_url'] = api_url
+            _SESSION['target'] = (api_url,
+                                  cf_target[cf_cli.CfInfo.ORG_KEY],
+                                  cf_target[cf_cli.CfInfo.SPACE_KEY])
+            _SESSION['session'] = session
+        return _SESSION['session'], _SESSION['api_url']
+
+
+def _current_target():
+    _get_session_and_api_url()
+    return _SESSION['target']
+
+
+def _cli_skips_ssl_validation():
+    cf_home = os.environ.get('CF_HOME', os.path.expanduser('~'))
+    try:
+        with open(os.path.join(cf_home, '.cf', 'config.json'), 'rb') as config_file:
+            return bool(json_loads(config_file.read()).get('SSLDisabled'))
+    except (IOError, ValueError):
+        return False
+
+
+def _request(method, path, **kwargs):
+    session, api_url = _get_session_and_api_url()
+    url = api_url + path
+    rejected_token = session.headers['Authorization']
+    response = session.request(method, url, **kwargs)
+    if response.status_code == 401:
+        # token has expired, "cf oauth-token" gets a fresh one
+        response.close()
+        _refresh_token(session, rejected_token)
+        response = session.request(method, url, **kwargs)
+    return response
+
+
+def _refresh_token(session, rejected_token):
+    with _SESSION_LOCK:
+        # other threads rejected with the same token may have refreshed it already
+        if session.headers['Authorization'] == rejected_token:
+            session.headers['Authorization'] = cf_cli.oauth_token()
+
+
+cf_cli.add_target_change_listener(reset_session)
+cf_cli.add_service_change_listener(invalidate_instance_cache)
@@ -25,6 +25,8 @@ from subprocess import Popen, PIPE, STDOUT
 
 CF = 'cf'
 _log = logging.getLogger(__name__) # pylint: disable=invalid-name
+_TARGET_CHANGE_LISTENERS = []
+_SERVICE_CHANGE_LISTENERS = []
 
 
 BuildpackDescription = namedtuple('BuildpackDescription',
@@ -55,6 +57,9 @@ class CfInfo(object):
         target_required (bool): I target change required (e.g. Org or Space has changed).
     """
 
+    __slots__ = ('api_url', 'password', 'user', 'org', 'space', 'ssl_validation',
+                 'login_required', 'target_required')
+
     CF_API_KEY = 'API endpoint'
     USER_KEY = 'User'
     PASSWORD_KEY = 'Password'
@@ -238,6 +243,7 @@ def create_service(broker, plan, instance_name, params_json=None):
                      '-c', params_json])
     else:
         run_command([CF, 'create-service', broker, plan, instance_name])
+    _notify_service_change()
 
 
 def create_service_broker(name, user, password, url):
@@ -306,6 +312,7 @@ def create_user_provided_service(service_name, credentials):
         CommandFailedError: When the command fails (returns non-zero code).
     """
     run_command([CF, 'create-user-provided-service', service_name, '-p', credentials])
+    _notify_service_change()
 
 
 def enable_service_access(broker):
@@ -473,6 +480,7 @@ def update_user_provided_service(service_name, credentials):
         CommandFailedError: When the command fails (returns non-zero code).
     """
     run_command([CF, 'update-user-provided-service', service_name, '-p', credentials])
+    _notify_service_change()
 
 
 def create_security_group(security_group, path_to_json):
@@ -517,7 +525,9 @@ def api(api_url, ssl_validation):
     if not ssl_validation:
         command.insert(-1, '--skip-ssl-validation')
     proc = Popen(command)
-    if proc.wait() != 0:
+    proc.wait()
+    _notify_target_change()
+    if proc.returncode != 0:
         raise CommandFailedError('Command failed: {}'.format(' '.join(command)))
 
 
@@ -532,7 +542,9 @@ def auth(username, password):
         CommandFailedError: When the command fails (returns non-zero code).
     """
     proc = Popen([CF, 'auth', username, password])
-    if proc.wait() != 0:
+    proc.wait()
+    _notify_target_change()
+    if proc.returncode != 0:
         raise CommandFailedError('Failed to login user: {}'.format(username))
 
 
@@ -546,7 +558,30 @@ def target(org, space):
     Raises:
         CommandFailedError: When the command fails (returns non-zero code).
     """
-    run_command([CF, 'target', '-o', org, '-s', space])
+    try:
+        run_command([CF, 'target', '-o', org, '-s', space])
+    finally:
+        _notify_target_change()
+
+
+def add_target_change_listener(listener):
+    """Registers a function called (without arguments) after `api`, `auth` or `target` are run,
+    as they change the API endpoint, user, org or space used by CF CLI.
+
+    Args:
+        listener (function): Function to call.
+    """
+    _TARGET_CHANGE_LISTENERS.append(listener)
+
+
+def add_service_change_listener(listener):
+    """Registers a function called (without arguments) after service instances are created or
+    updated through this module.
+
+    Args:
+        listener (function): Function to call.
+    """
+    _SERVICE_CHANGE_LISTENERS.append(listener)
 
 
 def get_current_cli_target():
@@ -573,6 +608,10 @@ def get_command_output(command):
 
     Raises:
         CommandFailedError: When the command fails (returns non-zero code).
+
+    Returns:
+        bytes: Raw standard output of the command, not decoded, so it can be passed to JSON
+            parsers as it is.
     """
     proc = Popen(command, stdout=PIPE)
     output = proc.communicate()[0]
@@ -606,6 +645,16 @@ def run_command(command, work_dir='.', redirect_output=True):
             raise CommandFailedError('Failed command: {}'.format(' '.join(command)))
 
 
+def _notify_target_change():
+    for listener in _TARGET_CHANGE_LISTENERS:
+        listener()
+
+
+def _notify_service_change():
+    for listener in _SERVICE_CHANGE_LISTENERS:
+        listener()
+
+
 def _parse_target_cli_output(cli_output):
     target_dict = CfInfo.get_empty().get_target_dict()
     nonempty_lines = [line for line in cli_output.splitlines() if line]
@@ -19,14 +19,17 @@ Helper functions for custom deployment scripts.
 """
 
 import argparse
-import json
 import os
 import getpass
 import sys
 
 import requests
+from requests_toolbelt import MultipartEncoder
 
 from app_deployment_lib import cf_cli
+from app_deployment_lib._common import json_loads, parallel_map
+
+_PARSERS = {}
 
 
 def upload_to_hdfs(api_url, org_name, local_file_path, title, category='other'):
@@ -42,24 +45,30 @@ def upload_to_hdfs(api_url, org_name, local_file_path, title, category='other'):
     """
 
     org_guid = cf_cli.get_org_guid(org_name).decode("utf-8")
-    uploader_url = "http://hdfs-uploader.{}/rest/upload/{}" \
-        .format(_get_base_url(api_url), org_guid)
+    return _upload(_get_uploader_url(api_url, org_guid), org_guid, cf_cli.oauth_token(),
+                   local_file_path, title, category)
 
-    data = _get_upload_request_body(org_guid, category, title)
-    files = {
-        'file': open(local_file_path, 'rb')
-    }
 
-    response = requests.post(uploader_url, files=files,
-                             headers={'Authorization': cf_cli.oauth_token()},
-                             data=data)
-    response_json = json.loads(response.text)
+def upload_many_to_hdfs(api_url, org_name, uploads, category='other', max_workers=4):
+    """
+    Uploads several files to HDFS in parallel, see `upload_to_hdfs`
 
-    if response.status_code == 201:
-        return response_json["objectStoreId"] + "/" \
-               + response_json["idInObjectStore"]
-    else:
-        raise Exception(response_json["message"])
+    Attributes:
+        api_url (str): CF API URL, e.g. http://api.example.com
+        org_name (str): GUID of organization in which the files will be uploaded
+        uploads (list[tuple]): (local_file_path, title) pairs of files to upload
+        max_workers (int): maximal number of simultaneous uploads
+
+    Returns:
+        list[str]: HDFS paths of uploaded files, in the order of uploads
+    """
+    # CF CLI is called once, only the HTTP uploads run in parallel
+    org_guid = cf_cli.get_org_guid(org_name).decode("utf-8")
+    uploader_url = _get_uploader_url(api_url, org_guid)
+    token = cf_cli.oauth_token()
+    return parallel_map(
+        lambda upload: _upload(uploader_url, org_guid, token, upload[0], upload[1], category),
+        uploads, max_workers)
 
 
 def get_parser(app_name):
@@ -102,7 +111,7 @@ def parse_args(app_name):
         app_name (str): name of the application to be deployed
     """
 
-    parser = get_parser(app_name)
+    parser = _get_cached_parser(app_name)
     return parser.parse_args()
 
 
@@ -117,9 +126,10 @@ def get_info(args):
 
     """
 
+    cf_info_class = cf_cli.CfInfo
     no_interact = args.no_interact
     current_target = cf_cli.get_current_cli_target()
-    arg_info = cf_cli.CfInfo(args.api_url, args.password, args.user, args.org,
+    arg_info = cf_info_class(args.api_url, args.password, args.user, args.org,
                              args.space)
     arg_provided_target = arg_info.get_target_dict(include_password=True)
     new_target = _extract_new_target(current_target, arg_provided_target,
@@ -128,7 +138,7 @@ def get_info(args):
     target_required = _is_target_required(login_required,
                                           new_target, current_target)
 
-    return cf_cli.CfInfo.from_target_dict(new_target, login_required,
+    return cf_info_class.from_target_dict(new_target, login_required,
                                           target_required)
 
 
@@ -163,18 +173,49 @@ def get_project_dir():
     return os.path.abspath(os.path.join(script_dir_path, os.path.pardir))
 
 
+def _upload(uploader_url, org_guid, token,  # pylint: disable=too-many-arguments
+            local_file_path, title, category):
+    with open(local_file_path, 'rb') as local_file:
+        # the uploader reads the metadata fields before the file, so the file part goes last
+        fields = list(_get_upload_request_body(org_guid, category, title).items()) + [
+            ('file', (os.path.basename(local_file_path), local_file, 'application/octet-stream'))]
+        # the encoder reads the file in chunks while sending, instead of loading it into memory
+        encoder = MultipartEncoder(fields=fields)
+        response = requests.post(uploader_url, data=encoder,
+                                 headers={'Authorization': token,
+                                          'Content-Type': encoder.content_type})
+    response_json = json_loads(response.content)
+
+    if response.status_code == 201:
+        return response_json["objectStoreId"] + "/" \
+               + response_json["idInObjectStore"]
+    else:
+        raise Exception(response_json["message"])
+
+
+def _get_uploader_url(api_url, org_guid):
+    return "http://hdfs-uploader.{}/rest/upload/{}".format(_get_base_url(api_url), org_guid)
+
+
+def _get_cached_parser(app_name):
+    if app_name not in _PARSERS:
+        _PARSERS[app_name] = get_parser(app_name)
+    return _PARSERS[app_name]
+
+
 def _get_upload_request_body(org_guid, file_category, file_title, public=False):
     data = {
         'orgUUID': org_guid,
         'category': file_category,
         'title': file_title,
-        'publicRequest': public
+        'publicRequest': str(public)
     }
     return data
 
 
 def _get_base_url(api_url):
-    base_url = api_url.partition('.')[2]
+    separator_index = api_url.find('.')
+    base_url = api_url[separator_index + 1:] if separator_index >= 0 else ''
     if not base_url:
         raise ValueError('API URL format is invalid')
     return base_url
@@ -18,14 +18,16 @@
 Helper functions for deploying apps to Gearpunp instance.
 """
 import os
-import pickle
-import json
 import requests
-import yaml
+from requests_toolbelt import MultipartEncoder
 from app_deployment_lib import cf_api
+from app_deployment_lib._common import json_dumps, json_loads, parallel_map
 
 GEARPUMP_COOKIE_NAME = 'gpcookie'
-REQUEST_BODY_FILE = 'request_body'
+MAX_PARALLEL_INSTANCES = 8
+
+_TARGET_DIR = "../target"
+_JAR_SUFFIX = "-with-dependencies.jar"
 
 
 def prepare_deploy_req_data(service_instances, users_args):
@@ -40,27 +42,22 @@ def prepare_deploy_req_data(service_instances, users_args):
         request body section
     """
     json_data = {}
-    for instance in service_instances:
-        instance_properties, instance_credentials = \
-            get_service_instance_data(instance)
-        instance_body = [{
+    instances_data = parallel_map(get_service_instance_data, service_instances,
+                                  MAX_PARALLEL_INSTANCES)
+    for instance, (instance_properties, instance_credentials) in \
+            zip(service_instances, instances_data):
+        json_data.setdefault(instance_properties['label'], []).append({
             "label" : instance_properties['label'],
             "name" : instance,
             "plan" : instance_properties['plan'],
             "tags" : instance_properties['tags'],
             "credentials" : instance_credentials
-        }]
-        json_data[instance_properties['label']] = instance_body
+        })
 
-    json_data = _encode_json_to_utf8(_add_user_args_section(json_data, users_args))
+    json_data['usersArgs'] = users_args
     return json_data
 
 
-def _add_user_args_section(body_data_json, users_args):
-    body_data_json['usersArgs'] = users_args
-    return body_data_json
-
-
 def get_service_instance_data(instance_name):
     """
     Gets data (including credentials) for particular service instance
@@ -69,10 +66,9 @@ def get_service_instance_data(instance_name):
         instance_name (str): service-instance name
     """
     instance_data_for_req = {}
-    instance_data = cf_api.get_service_instance(instance_name)['entity']
-    service_plan_data = cf_api.cf_curl_get(instance_data['service_plan_url'])['entity']
-    service_url = service_plan_data['service_url']
-    service_data = cf_api.cf_curl_get(service_url)['entity']
+    instance_data = cf_api.get_service_instance_with_relations(instance_name)['entity']
+    service_plan_data = instance_data['service_plan']['entity']
+    service_data = service_plan_data['service']['entity']
     instance_data_for_req['plan'] = service_plan_data['name']
     instance_data_for_req['tags'] = instance_data['tags']
     instance_data_for_req['label'] = service_data['label']
@@ -85,9 +81,73 @@ def get_jar_file_name():
     Gets file name of the jar to be deployed.
 
     """
-    for dir_file in os.listdir("../target"):
-        if dir_file.endswith("-with-dependencies.jar"):
-            return dir_file
+    if not hasattr(os, 'scandir'):
+        return _find_jar_file_name(os.listdir(_TARGET_DIR))
+    dir_entries = os.scandir(_TARGET_DIR)  # pylint: disable=no-member
+    # scandir iterators can be used in "with" (and so closed early) only since Python 3.6
+    if not hasattr(dir_entries, '__enter__'):
+        return _find_jar_file_name(entry.name for entry in dir_entries)
+    with dir_entries:
+        return _find_jar_file_name(entry.name for entry in dir_entries)
+
+
+def _find_jar_file_name(file_names):
+    return next((file_name for file_name in file_names if file_name.endswith(_JAR_SUFFIX)), None)
+
+
+class GearpumpClient(object):
+    """
+    Client of Gearpump REST API. Login cookie is kept in the client's session,
+    so it is sent with every subsequent request.
+
+    Attributes:
+        gearpump_url (str): url of gearpump service instance, "http://" is
+        assumed when it has no scheme
+        session (requests.Session): session used for all requests of the client
+    """
+
+    def __init__(self, gearpump_url, username=None, password=None, session=None):
+        self.gearpump_url = _normalize_url(gearpump_url)
+        self.session = session if session is not None else requests.Session()
+        if username is not None:
+            self.login(username, password)
+
+    def login(self, username, password):
+        """
+        Logs-in to Gearpump
+
+        Attributes:
+            username: Gearpump service admin
+            password: Gearpump service admin's password
+        """
+        body = {
+            'username': username,
+            'password': password
+        }
+        gearpump_login_url = '{}/login'.format(self.gearpump_url)
+        response = self.session.post(gearpump_login_url, data=body)
+        return response.text
+
+    def deploy(self, local_file_path, users_args, bound_instances):
+        """
+        Uploads file to Gearpump
+
+        Attributes:
+            local_file_path (str): path to a jar file to be deployed
+            users_args (dict): argument-value pairs passed to the application
+            bound_instances (list): names of service instances the application uses
+        """
+        gearpump_deploy_url = '{}/api/v1.0/master/submitapp'.format(self.gearpump_url)
+        deploy_request_data = prepare_deploy_req_data(bound_instances, users_args)
+
+        with open(local_file_path, 'rb') as jar_file:
+            encoder = MultipartEncoder(fields=[
+                ('configstring', b"tap=" + json_dumps(deploy_request_data)),
+                ('jar', (os.path.basename(local_file_path), jar_file, 'application/java-archive'))
+            ])
+            response = self.session.post(gearpump_deploy_url, data=encoder,
+                                         headers={'Content-Type': encoder.content_type})
+        return response.text
 
 
 def gearpump_login(gearpump_url, username, password):
@@ -100,47 +160,45 @@ def gearpump_login(gearpump_url, username, password):
         username: Gearpump service admin
         password: Gearpump service admin's password
     """
-    body = {
-        'username': username,
-        'password': password
-    }
-    gearpump_login_url = "http://" + gearpump_url + "/login"
-    response = requests.post(gearpump_login_url, data=body)
-    save_to_file(response.cookies, GEARPUMP_COOKIE_NAME)
-    return response.text
+    client = GearpumpClient(gearpump_url)
+    response_text = client.login(username, password)
+    save_to_file(requests.utils.dict_from_cookiejar(client.session.cookies),
+                 GEARPUMP_COOKIE_NAME)
+    return response_text
 
 
 def save_to_file(data, filename):
     """
-    Serializes data
+    Serializes data to JSON
 
     Attributes:
-        data (obj): data to serialize
+        data (obj): JSON-serializable data
         filename (str): name of the file to store data
     """
     with open(filename, 'wb') as tmp_file:
-        pickle.dump(data, tmp_file)
+        tmp_file.write(json_dumps(data))
 
 
 def load_file(filename):
     """
-    Loads file from disk
+    Loads JSON file from disk
 
     Attributes:
         filename (str): name of the file to load
     """
     with open(filename, 'rb') as tmp_file:
-        return pickle.load(tmp_file)
+        return json_loads(tmp_file.read())
 
 
 def delete_file(filename):
     """
-    Deletes file from disk
+    Deletes file from disk. Does nothing if the file doesn't exist.
 
     Attributes:
         filename (str): name of the file to be deleted
     """
-    os.remove(filename)
+    if os.path.exists(filename):
+        os.remove(filename)
 
 
 def deploy_to_gearpump(gearpump_url, local_file_path, users_args, bound_instances):
@@ -150,26 +208,23 @@ def deploy_to_gearpump(gearpump_url, local_file_path, users_args, bound_instance
     Attributes:
         gearpump_url (str): url of gearpump service instance
         local_file_path (str): path to a jar file to be deployed
-    """
-    gearpump_deploy_url = "http://" + gearpump_url + "/api/v1.0/master/submitapp"
-    deploy_request_data = prepare_deploy_req_data(bound_instances, users_args)
-
-    with open(REQUEST_BODY_FILE, "w") as text_file:
-        text_file.write("tap=" + str(deploy_request_data).replace("'", "\""))
-
-    files = {
-        'jar': open(local_file_path, 'rb')
-    }
-    data = {
-        'configstring': open(REQUEST_BODY_FILE, 'rb')
-    }
-
-    response = requests.post(gearpump_deploy_url, data=data, files=files,
-                             verify=False, cookies=load_file(GEARPUMP_COOKIE_NAME))
-    delete_file(GEARPUMP_COOKIE_NAME)
-    delete_file(REQUEST_BODY_FILE)
-    return response.text
-
 
-def _encode_json_to_utf8(json_input):
-    return yaml.safe_load(json.dumps(json_input))
+    Raises:
+        IOError: When there is no readable cookie saved by `gearpump_login`.
+    """
+    client = GearpumpClient(gearpump_url)
+    try:
+        requests.utils.add_dict_to_cookiejar(client.session.cookies,
+                                             load_file(GEARPUMP_COOKIE_NAME))
+    except (IOError, ValueError):
+        raise IOError('No valid Gearpump login cookie found in {}, log in again with '
+                      'gearpump_login.'.format(GEARPUMP_COOKIE_NAME))
+    finally:
+        delete_file(GEARPUMP_COOKIE_NAME)
+    return client.deploy(local_file_path, users_args, bound_instances)
+
+
+def _normalize_url(url):
+    if '://' not in url:
+        url = 'http://' + url
+    return url.rstrip('/')
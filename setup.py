@@ -19,7 +19,8 @@ from setuptools import setup, find_packages
 
 setup_dir = os.path.dirname(os.path.abspath(__file__))
 with open(os.path.join(setup_dir, 'requirements.txt')) as req_file:
-    requirements = [lib.split('==')[0] for lib in req_file.readlines()]
+    requirements = [line.partition('==')[0].strip() for line in req_file
+                    if line.strip() and not line.startswith('#')]
 
 setup(
     name='app_deployment_lib',